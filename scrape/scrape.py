@@ -227,6 +227,12 @@ def db_dodaj_datoteko(conn, datoteka: Datoteka, gradivo: Gradivo):
         )
     conn.commit()
 
+    # Posodobi vnaprej izračunane zadetke pogostih poizvedb, ki se pojavijo v novi datoteki, in seznam besed za predloge
+    print("      Posodabljam zadetke pogostih poizvedb in seznam besed")
+    cursor.execute("SELECT osvezi_repozitorij_zadetke(%s)", (datoteka.id,))
+    cursor.execute("SELECT posodobi_besede_strani(%s, 1)", (datoteka.id,))
+    conn.commit()
+
 
 def db_ali_gradivo_obstaja(conn, gradivo: Gradivo) -> bool:
     """
@@ -241,6 +247,82 @@ def db_ali_gradivo_obstaja(conn, gradivo: Gradivo) -> bool:
     return len(result) != 0
 
 
+def db_datoteke_gradiva(conn, gradivo: Gradivo) -> dict[int, str]:
+    """
+    Vrne IDje in URLje datotek gradiva, ki so že v bazi
+    """
+
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT id, url FROM datoteke WHERE gradivo_id = %s", (gradivo.id,))
+
+    return {id: url for id, url in cursor.fetchall()}
+
+
+def db_odstrani_datoteko(conn, datoteka_id: int):
+    """
+    Iz baze odstrani datoteko, njene strani in vnaprej izračunane zadetke
+    """
+
+    cursor = conn.cursor()
+
+    print(f"    Odstranjujem datoteko {datoteka_id}")
+    cursor.execute("SELECT posodobi_besede_strani(%s, -1)", (datoteka_id,))
+    cursor.execute("DELETE FROM repozitorij_zadetki WHERE datoteka_id = %s", (datoteka_id,))
+    cursor.execute("DELETE FROM strani WHERE datoteka_id = %s", (datoteka_id,))
+    cursor.execute("DELETE FROM datoteke WHERE id = %s", (datoteka_id,))
+    conn.commit()
+
+
+def posodobi_gradivo(conn, gradivo: Gradivo):
+    """
+    Primerja datoteke gradiva v repozitoriju s tistimi v bazi. Prenese le nove ali spremenjene datoteke in odstrani tiste, ki jih ni več
+    """
+
+    obstojece = db_datoteke_gradiva(conn, gradivo)
+    nove_id = {datoteka.id for datoteka in gradivo.datoteke}
+
+    for datoteka_id in obstojece.keys() - nove_id:
+        db_odstrani_datoteko(conn, datoteka_id)
+
+    for datoteka in gradivo.datoteke:
+        if obstojece.get(datoteka.id) == datoteka.url:
+            continue
+
+        print(f"    Prenašam strani za datoteko {datoteka.url}")
+        datoteka.strani = extract_strani(datoteka.url)
+
+        # Če strani ni bilo mogoče prebrati, datoteke ne shranimo, da jo ob naslednji posodobitvi poskusimo znova
+        if not datoteka.strani:
+            print(f"    Ni strani, datoteko preskočim")
+            continue
+
+        # Datoteka z istim IDjem, a drugim URLjem je bila zamenjana, zato njene stare strani odstranimo
+        if datoteka.id in obstojece:
+            db_odstrani_datoteko(conn, datoteka.id)
+
+        db_dodaj_datoteko(conn, datoteka, gradivo)
+
+
+def db_napolni_besede(conn):
+    """
+    Iz vseh strani na novo zgradi seznam besed, ki ga spletna aplikacija uporablja za predloge podobnih izrazov.
+    Prebere celoten korpus, zato je potreben le enkrat, ko se tabela ustvari. Kasneje se seznam posodablja ob dodajanju datotek.
+    """
+
+    cursor = conn.cursor()
+
+    print("Gradim seznam besed iz vseh strani")
+    cursor.execute("TRUNCATE besede_strani")
+    cursor.execute(
+        """
+        INSERT INTO besede_strani (beseda, ndoc)
+        SELECT word, ndoc FROM ts_stat('SELECT text_tsv FROM strani') WHERE length(word) BETWEEN 3 AND 50
+    """
+    )
+    conn.commit()
+
+
 def scrape_search_result_page(source_id: int, page: int) -> tuple[list[Gradivo], bool]:
     """
     Scrapa eno stran gradiv in vrne seznam gradiv ter bool, ki pove ali lahko scrapamo tudi naslednjo stran ali smo že na koncu (true=lahko nadaljujemo)
@@ -263,9 +345,9 @@ def scrape_search_result_page(source_id: int, page: int) -> tuple[list[Gradivo],
     return gradiva, should_continue
 
 
-def scrape_faks(conn, all=False, source_id=25, start_page=1):
+def scrape_faks(conn, all=False, update=False, source_id=25, start_page=1):
     """
-    V sistem prenese vso gradivo z določenega faksa
+    V sistem prenese vso gradivo z določenega faksa. Če je update=True, pri gradivih, ki so že v bazi, posodobi le spremenjene datoteke
     """
 
     page = start_page
@@ -275,13 +357,17 @@ def scrape_faks(conn, all=False, source_id=25, start_page=1):
         gradiva, should_continue = scrape_search_result_page(source_id, page)
 
         page += 1
-        if not should_continue:
-            break
 
         for gradivo in gradiva:
             print(f"  Obdelujem gradivo {gradivo.naslov}")
 
-            # Preveri ali gradivo že obstaja v bazi, če je all=True nadaljuj, če ne končaj
+            # Preveri ali gradivo že obstaja v bazi, če je update=True ga posodobi, če je all=True nadaljuj, drugače končaj
+            if update and db_ali_gradivo_obstaja(conn, gradivo):
+                print(f"    Že obstaja v bazi, posodabljam datoteke")
+                posodobi_gradivo(conn, gradivo)
+                print()
+                continue
+
             if not all and db_ali_gradivo_obstaja(conn, gradivo):
                 print(f"    Že obstaja v bazi, končujem")
                 return
@@ -299,11 +385,17 @@ def scrape_faks(conn, all=False, source_id=25, start_page=1):
             for oseba in gradivo.avtorji:
                 db_dodaj_osebe(conn, oseba, gradivo)
 
+            # Datotek brez strani ne shranimo, da jih posodobitev (--update) poskusi prenesti znova
             for datoteka in gradivo.datoteke:
-                db_dodaj_datoteko(conn, datoteka, gradivo)
+                if datoteka.strani:
+                    db_dodaj_datoteko(conn, datoteka, gradivo)
 
             print()
 
+        # Zadnjo stran obdelamo, preden končamo
+        if not should_continue:
+            break
+
 
 if __name__ == "__main__":
     conn = psycopg2.connect(**DB_CONFIG)
@@ -321,6 +413,14 @@ if __name__ == "__main__":
         "-a",
         help="Prenesi vsa gradiva. Privzeto se ustavi ko pride do prvega gradiva, ki je že v bazi",
     )
+    scrape_parser.add_argument(
+        "--update",
+        "-u",
+        action="store_true",
+        help="Preglej vsa gradiva in pri tistih, ki so že v bazi, prenesi le nove ali spremenjene datoteke ter odstrani tiste, ki jih v repozitoriju ni več",
+    )
+
+    subparsers.add_parser("besede", help="Iz vseh strani na novo zgradi seznam besed za predloge podobnih izrazov")
 
     args = parser.parse_args()
 
@@ -328,7 +428,9 @@ if __name__ == "__main__":
         ids = args.ids.split(",")
         for id in ids:
             print(f"Začenjam scrapanje za organizacijo {id}")
-            scrape_faks(conn, all=args.all, source_id=id)
+            scrape_faks(conn, all=args.all, update=args.update, source_id=id)
+    elif args.command == "besede":
+        db_napolni_besede(conn)
     else:
         print("Navedite ukaz")
 
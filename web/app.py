@@ -1,14 +1,41 @@
-from flask import Flask, request, render_template
-from bs4 import BeautifulSoup
-import requests
-from dataclasses import dataclass
-from googletrans import Translator
+from flask import Flask, request, render_template, jsonify, url_for, make_response
+from dataclasses import dataclass, asdict
 import asyncio
 import re
 from typing import Dict, Any
 import tomllib
 from pathlib import Path
-import psycopg2
+import bisect
+import threading
+import time
+import json
+import hashlib
+import gzip
+import importlib.util
+import sys
+from contextlib import contextmanager
+
+
+def lazy_import(name: str):
+    """
+    Vrne modul, ki se dejansko naloži šele ob prvi uporabi, da se aplikacija hitreje zažene
+    """
+
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+requests = lazy_import("requests")
+bs4 = lazy_import("bs4")
+googletrans = lazy_import("googletrans")
+psycopg2 = lazy_import("psycopg2")
 
 app = Flask(__name__)
 
@@ -17,8 +44,83 @@ config_path = Path(__file__).parent / "config.toml"
 with config_path.open("rb") as f:
     config = tomllib.load(f)
 
-DB_CONFIG = config["database"]
+DB_CONFIG = dict(config["database"])
+DB_POOL_SIZE = DB_CONFIG.pop("pool_size", 10)
 REQUEST_TIMEOUT = config["requests"]["timeout"]
+AUTOCOMPLETE_CONFIG = config.get("autocomplete", {})
+AUTOCOMPLETE_LIMIT = AUTOCOMPLETE_CONFIG.get("limit", 10)
+AUTOCOMPLETE_REFRESH_INTERVAL = AUTOCOMPLETE_CONFIG.get("refresh_interval", 60)
+# Vrstice iz drugih procesov se lahko potrdijo v drugačnem vrstnem redu kot so dobile id, zato ob vsaki osvežitvi ponovno preberemo nekaj zadnjih
+AUTOCOMPLETE_REFRESH_OVERLAP = 1000
+FUZZY_CONFIG = config.get("fuzzy", {})
+FUZZY_LIMIT = FUZZY_CONFIG.get("limit", 5)
+FUZZY_THRESHOLD = FUZZY_CONFIG.get("threshold", 0.3)
+FUZZY_TIMEOUT = FUZZY_CONFIG.get("timeout", 200)
+REPOZITORIJ_MATERIALIZE_AFTER = config.get("repozitorij", {}).get("materialize_after", 3)
+REPOZITORIJ_MATERIALIZE_TOP = config.get("repozitorij", {}).get("materialize_top", 100)
+
+# Koliko sekund lahko brskalnik ali proxy hrani rezultate posameznega vira
+CACHE_MAX_AGE = {
+    "dis_slovarcek": 86400,
+    "ltfe": 86400,
+    "sdrv": 86400,
+    "ijs": 86400,
+    "islovar": 86400,
+    "ezs_glosar": 86400,
+    "ui_slovar": 86400,
+    "google_translate": 3600,
+    "repozitorij": 3600,
+} | config.get("cache", {}).get("max_age", {})
+GZIP_MIN_SIZE = 500  # Manjših odgovorov se ne splača stiskati
+
+WARMING_CONFIG = config.get("warming", {})
+WARMING_ENABLED = WARMING_CONFIG.get("enabled", True)
+WARMING_INTERVAL = WARMING_CONFIG.get("interval", 3600)
+WARMING_TOP = WARMING_CONFIG.get("top", 100)
+WARMING_DELAY = WARMING_CONFIG.get("delay", 2)
+WARMING_SLOVARJI = WARMING_CONFIG.get(
+    "slovarji", ["dis_slovarcek", "sdrv", "ijs", "islovar", "ezs_glosar", "ui_slovar", "google_translate"]
+)
+WARMING_LOCK_ID = 4201  # ID advisory locka, da cache hkrati ogreva le en proces
+
+db_pool = None
+db_pool_lock = threading.Lock()
+db_pool_semafor = threading.BoundedSemaphore(DB_POOL_SIZE)
+
+
+@contextmanager
+def db_povezava():
+    """
+    Izposodi si povezavo iz skupnega poola in jo po uporabi vrne. Če je vse povezave v uporabi, počaka, da se katera sprosti.
+    Ob uspešnem koncu se transakcija potrdi, ob napaki pa razveljavi.
+    """
+
+    global db_pool
+    with db_pool_lock:
+        if db_pool is None:
+            import psycopg2.pool
+
+            # Pool vrnjene povezave nad minconn zapre, zato je minconn enak maxconn, da se povezave res ponovno uporabijo
+            db_pool = psycopg2.pool.ThreadedConnectionPool(DB_POOL_SIZE, DB_POOL_SIZE, **DB_CONFIG)
+
+    # ThreadedConnectionPool ob prazenem poolu vrže napako namesto da bi počakal, zato število izposojenih povezav omejimo sami
+    with db_pool_semafor:
+        connection = db_pool.getconn()
+        try:
+            yield connection
+            connection.commit()
+        except Exception:
+            if not connection.closed:
+                connection.rollback()
+            raise
+        finally:
+            db_pool.putconn(connection, close=bool(connection.closed))
+
+
+# ETag mora biti drugačen, če se spremenijo templati, čeprav so podatki enaki
+TEMPLATES_HASH = hashlib.sha256(
+    b"".join(f.read_bytes() for f in sorted((Path(__file__).parent / "templates").glob("*.html")))
+).hexdigest()[:16]
 
 
 @dataclass
@@ -38,6 +140,144 @@ class repozitorij_result:
     stevilka_strani_skupaj: list[int]
 
 
+@dataclass
+class repozitorij_fasete:
+    skupaj: int  # Število vseh gradiv z zadetki
+    leta: list[tuple[int, int]]  # (leto, število gradiv)
+    organizacije: list[tuple[str, int]]  # (organizacija, število gradiv)
+
+
+@dataclass
+class zdruzen_result:
+    en: str
+    sl: str
+    viri: list[str]  # Slovarji, ki vrnejo ta prevod
+    ocena: float  # Delež slovarjev z rezultati, ki se strinjajo s tem prevodom
+    st_virov: int  # Število slovarjev z rezultati
+
+
+IMENA_SLOVARJEV = {
+    "dis_slovarcek": "DIS slovarček",
+    "ltfe": "LTFE IKT slovar",
+    "sdrv": "Slovar SDRV",
+    "ijs": "Slovar IJS",
+    "islovar": "Islovar",
+    "ezs_glosar": "EZS Glosar",
+    "ui_slovar": "Terminološki slovar s področja umetne inteligence",
+    "google_translate": "Google Translate",
+}
+
+# IJS namesto šumnikov vrača "c, "s in "z
+SUMNIKI_IJS = {'"c': "č", '"C': "Č", '"s': "š", '"S': "Š", '"z': "ž", '"Z': "Ž"}
+
+
+def popravi_sumnike(text: str) -> str:
+    for napacno, pravilno in SUMNIKI_IJS.items():
+        text = text.replace(napacno, pravilno)
+    return text
+
+
+class indeks_izrazov:
+    """
+    V pomnilniku hrani urejen seznam vseh znanih izrazov (angleških in slovenskih), da lahko hitro poiščemo predloge po predponi.
+    Izraze bere iz tabele izrazi, kamor shranimo vse rezultate slovarjev, ki smo jih že videli.
+    """
+
+    def __init__(self):
+        self.kljuci = []  # Normalizirani izrazi (casefold), urejeni po abecedi
+        self.izrazi = []  # Izvirni izrazi v enakem vrstnem redu kot kljuci
+        self.zadnji_id = 0  # Največji id iz tabele izrazi, ki je že v indeksu
+        self.nalozen = False  # Ali je bil indeks že vsaj enkrat prebran iz baze
+        self.zadnja_osvezitev = 0.0
+        self.osvezevanje = False
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def normaliziraj(izraz: str) -> str:
+        return " ".join(izraz.split())
+
+    def dodaj(self, izrazi: list[str]):
+        nov = {}
+        for izraz in izrazi:
+            izraz = self.normaliziraj(izraz)
+            if izraz:
+                nov.setdefault(izraz.casefold(), izraz)
+
+        with self.lock:
+            # Izpustimo izraze, ki so že v indeksu (npr. ker smo jih ponovno prebrali iz baze)
+            nov = {kljuc: izraz for kljuc, izraz in nov.items() if not self._vsebuje(kljuc)}
+
+            # Posamezne izraze vstavimo na pravo mesto, pri večjem številu pa je hitreje vse skupaj ponovno urediti
+            if len(nov) < 100:
+                for kljuc, izraz in nov.items():
+                    i = bisect.bisect_left(self.kljuci, kljuc)
+                    self.kljuci.insert(i, kljuc)
+                    self.izrazi.insert(i, izraz)
+            else:
+                for kljuc, izraz in zip(self.kljuci, self.izrazi):
+                    nov.setdefault(kljuc, izraz)
+                self.kljuci = sorted(nov)
+                self.izrazi = [nov[kljuc] for kljuc in self.kljuci]
+
+    def _vsebuje(self, kljuc: str) -> bool:
+        i = bisect.bisect_left(self.kljuci, kljuc)
+        return i < len(self.kljuci) and self.kljuci[i] == kljuc
+
+    def predlogi(self, predpona: str, limit: int) -> list[str]:
+        kljuc = self.normaliziraj(predpona).casefold()
+        if not kljuc:
+            return []
+
+        with self.lock:
+            i = bisect.bisect_left(self.kljuci, kljuc)
+            predlogi = []
+            while i < len(self.kljuci) and len(predlogi) < limit and self.kljuci[i].startswith(kljuc):
+                predlogi.append(self.izrazi[i])
+                i += 1
+
+        return predlogi
+
+    def osvezi(self):
+        """
+        Iz baze prebere izraze, ki so bili dodani od zadnje osvežitve
+        """
+
+        try:
+            with db_povezava() as connection:
+                cursor = connection.cursor()
+                cursor.execute(
+                    "SELECT id, en, sl FROM izrazi WHERE id > %s ORDER BY id",
+                    (self.zadnji_id - AUTOCOMPLETE_REFRESH_OVERLAP,),
+                )
+                vrstice = cursor.fetchall()
+
+            if vrstice:
+                self.dodaj([izraz for vrstica in vrstice for izraz in vrstica[1:]])
+                self.zadnji_id = max(self.zadnji_id, vrstice[-1][0])
+            self.nalozen = True
+            # Čas zabeležimo le ob uspešni osvežitvi, da neuspešno (npr. pred migracijami) naslednji request takoj ponovi
+            self.zadnja_osvezitev = time.monotonic()
+        except psycopg2.Error as e:
+            print(f"Error refreshing term index: {e}")
+        finally:
+            self.osvezevanje = False
+
+    def osvezi_ce_potrebno(self):
+        """
+        Če je indeks starejši od AUTOCOMPLETE_REFRESH_INTERVAL, ga osveži v ozadju, da ne upočasnimo trenutnega requesta
+        """
+
+        with self.lock:
+            if self.osvezevanje or time.monotonic() - self.zadnja_osvezitev < AUTOCOMPLETE_REFRESH_INTERVAL:
+                return
+            self.osvezevanje = True
+
+        threading.Thread(target=self.osvezi, daemon=True).start()
+
+
+indeks = indeks_izrazov()
+
+
 def dis_slovarcek(query: str) -> list[slovar_result]:
     print("DIS Slovarček: ", query)
 
@@ -50,7 +290,7 @@ def dis_slovarcek(query: str) -> list[slovar_result]:
         )
         return []
 
-    soup = BeautifulSoup(response.content, "html.parser")
+    soup = bs4.BeautifulSoup(response.content, "html.parser")
     result_containers = soup.find_all(id="all-search-results")
 
     results = []
@@ -78,7 +318,7 @@ def ltft(query: str) -> list[slovar_result]:
             print(f"Error accessing {full_url}: {e}")
             return
 
-        soup = BeautifulSoup(response.text, "html.parser")
+        soup = bs4.BeautifulSoup(response.text, "html.parser")
         result_containers = soup.select(".wHead")
 
         for container in result_containers:
@@ -110,7 +350,7 @@ def sdrv(query: str) -> list[slovar_result]:
     # Get the CSRF token
     search_url = f"{base_url}/dictionary/search/"
     response = session.get(search_url, timeout=REQUEST_TIMEOUT)
-    soup = BeautifulSoup(response.text, "html.parser")
+    soup = bs4.BeautifulSoup(response.text, "html.parser")
 
     # Find the CSRF token in the HTML
     csrf_token = soup.find("input", {"name": "csrfmiddlewaretoken"})["value"]
@@ -126,7 +366,7 @@ def sdrv(query: str) -> list[slovar_result]:
         return []
 
     # Extract the list of terms from the search results
-    soup = BeautifulSoup(search_response.text, "html.parser")
+    soup = bs4.BeautifulSoup(search_response.text, "html.parser")
     h2s = soup.find_all("h2")  # Find all h2 elements
 
     # Najdi linke do vseh izrazov, ki jih vrne za naš query
@@ -147,7 +387,7 @@ def sdrv(query: str) -> list[slovar_result]:
         if response.status_code != 200:
             print("Error accessing SDRV term page. Status code:", response.status_code)
             continue
-        soup = BeautifulSoup(response.text, "html.parser")
+        soup = bs4.BeautifulSoup(response.text, "html.parser")
 
         en = soup.find("div", class_="phrase").get_text(strip=True)
         translations = soup.find_all("li", class_="translation")
@@ -183,13 +423,7 @@ def ijs(query: str) -> list[slovar_result]:
         en = pair[0].strip()
         sl = pair[1].strip()
 
-        # Popravi šumnike
-        sl = sl.replace('"c', "č")
-        sl = sl.replace('"C', "Č")
-        sl = sl.replace('"s', "š")
-        sl = sl.replace('"S', "Š")
-        sl = sl.replace('"z', "ž")
-        sl = sl.replace('"Z', "Ž")
+        sl = popravi_sumnike(sl)
 
         results.append(slovar_result(en, sl))
 
@@ -231,7 +465,7 @@ def ezs_glosar(query: str) -> list[slovar_result]:
         print(f"Error accessing {url}. Status code: {response.status_code}")
         return []
 
-    soup = BeautifulSoup(response.text, "html.parser")
+    soup = bs4.BeautifulSoup(response.text, "html.parser")
     articles = soup.find_all("article", class_="ezs-main-results-item")
 
     results = []
@@ -288,7 +522,7 @@ def ui_slovar(query: str) -> list[slovar_result]:
     if not response.ok:
         print(f"Error accessing {url}. Status code: {response.status_code}")
         return []
-    soup = BeautifulSoup(response.text, "html.parser")
+    soup = bs4.BeautifulSoup(response.text, "html.parser")
 
     # Extract total number of pages
     total_pages = 1
@@ -313,7 +547,7 @@ def ui_slovar(query: str) -> list[slovar_result]:
         if not response.ok:
             print(f"Error accessing page {page_num}. Status code: {response.status_code}")
             continue
-        soup = BeautifulSoup(response.text, "html.parser")
+        soup = bs4.BeautifulSoup(response.text, "html.parser")
 
         print(f"Scraping page {page_num}/{total_pages}")
         results.extend(parse_results_from_soup(soup))
@@ -323,114 +557,553 @@ def ui_slovar(query: str) -> list[slovar_result]:
 
 def google_translate(query: str) -> list[slovar_result]:
     print("Google Translate: ", query)
-    translator = Translator()
+    translator = googletrans.Translator()
     result = asyncio.run(translator.translate(query, dest="sl"))
     return [slovar_result(query, result.text)]
 
 
-def repozitorij(query: str, page: int) -> list[repozitorij_result]:
-    print("Repozitorij: ", query, "page:", page)
-    page_size = 101     # Page size rabi biti vsaj 101, da je spodnji query hiter (iz nekega razloga se pri manjšem limitu čisto pokvari plan in rabi 20+ sec namesto nekaj ms)
-    offset = (page - 1) * page_size
+SLOVARJI = {
+    "dis_slovarcek": dis_slovarcek,
+    "ltfe": ltft,
+    "sdrv": sdrv,
+    "ijs": ijs,
+    "islovar": islovar,
+    "ezs_glosar": ezs_glosar,
+    "ui_slovar": ui_slovar,
+    "google_translate": google_translate,
+}
 
-    connection = psycopg2.connect(**DB_CONFIG)
-    cursor = connection.cursor()
 
-    # Check if connection is successful
-    if connection.closed != 0:
-        print("Error connecting to the database.")
-        return []
+def normaliziraj_poizvedbo(query: str) -> str:
+    # Velikih črk ne spreminjamo, ker nekateri slovarji zanje vrnejo drugačne rezultate (npr. "IT" in "it")
+    return " ".join(query.split())
+
 
-    strani_query = f"""
-    SELECT gradivo_id, naslov, leto, repozitorij_url, url as datoteka_url,
-        STRING_AGG(stevilka_strani_skupaj::text, ',') as stevilke_strani_skupaj
-    from (SELECT datoteka_id, stevilka_strani_skupaj FROM strani WHERE text_tsv @@ plainto_tsquery(%s)) s
-    join datoteke d on s.datoteka_id = d.id
-    join gradiva g on d.gradivo_id = g.id
-    group by gradivo_id, naslov, leto, repozitorij_url, url
-    order by gradivo_id
-    limit %s offset %s
+def shrani_v_cache(slovar: str, poizvedba: str, rezultati: list[slovar_result]):
+    import psycopg2.extras
+
+    try:
+        with db_povezava() as connection:
+            cursor = connection.cursor()
+            cursor.execute(
+                """
+                INSERT INTO slovarji_cache (slovar, poizvedba, rezultati) VALUES (%s, %s, %s)
+                ON CONFLICT (slovar, poizvedba) DO UPDATE SET rezultati = EXCLUDED.rezultati, osvezeno = CURRENT_TIMESTAMP
+            """,
+                (slovar, poizvedba, psycopg2.extras.Json([asdict(r) for r in rezultati])),
+            )
+    except psycopg2.Error as e:
+        print(f"Error saving {slovar} results to cache: {e}")
+
+
+def poisci_v_slovarju(slovar: str, query: str) -> list[slovar_result]:
+    """
+    Vrne rezultate slovarja za poizvedbo. Če so v cache-u dovolj sveži rezultati, vrne te, drugače pošlje request slovarju.
+    Normalizirana poizvedba je le ključ v cache-u, slovarju pošljemo poizvedbo, kot jo je vpisal uporabnik.
     """
 
-    cursor.execute(strani_query, (query, page_size, offset))
-    strani = cursor.fetchall()
+    poizvedba = normaliziraj_poizvedbo(query)
 
-    results = []
-    for stran in strani:
-        gradivo_id = stran[0]
+    try:
+        with db_povezava() as connection:
+            cursor = connection.cursor()
+            cursor.execute(
+                """
+                SELECT rezultati FROM slovarji_cache
+                WHERE slovar = %s AND poizvedba = %s AND osvezeno > CURRENT_TIMESTAMP - make_interval(secs => %s)
+            """,
+                (slovar, poizvedba, CACHE_MAX_AGE[slovar]),
+            )
+            cached = cursor.fetchone()
 
-        cursor.execute(
-            """
-            SELECT ime, priimek
-            FROM osebe
-            JOIN gradiva_osebe ON osebe.id = gradiva_osebe.oseba_id
-            WHERE gradivo_id = %s
-        """,
-            (gradivo_id,),
-        )
-        avtorji = cursor.fetchall()
+        if cached:
+            return [slovar_result(**r) for r in cached[0]]
+    except psycopg2.Error as e:
+        print(f"Error reading {slovar} results from cache: {e}")
 
-        cursor.execute(
-            """
-            SELECT ime_kratko
-            FROM organizacije
-            JOIN gradiva_organizacije ON organizacije.id = gradiva_organizacije.organizacija_id
-            WHERE gradivo_id = %s
-        """,
-            (gradivo_id,),
-        )
-        organizacije = cursor.fetchall()
-
-        results.append(
-            repozitorij_result(
-                naslov=stran[1],
-                leto=stran[2],
-                avtorji=[f"{a[0]} {a[1]}" for a in avtorji],
-                organizacije=[o[0] for o in organizacije],
-                repozitorij_url=stran[3],
-                datoteka_url=stran[4],
-                stevilka_strani_skupaj=stran[5].split(","),
+    rezultati = SLOVARJI[slovar](query)
+
+    # Slovarji ob napaki vrnejo prazen seznam, zato praznih rezultatov ne shranimo
+    if rezultati:
+        shrani_v_cache(slovar, poizvedba, rezultati)
+
+    return rezultati
+
+
+def zabelezi_iskanje(query: str):
+    """
+    Zabeleži normalizirano poizvedbo, da lahko pogoste poizvedbe vnaprej osvežimo v cache-u
+    """
+
+    poizvedba = normaliziraj_poizvedbo(query)
+    if not poizvedba:
+        return
+
+    try:
+        with db_povezava() as connection:
+            cursor = connection.cursor()
+            cursor.execute(
+                """
+                INSERT INTO iskanja (poizvedba, izvirna, st_iskanj) VALUES (%s, %s, 1)
+                ON CONFLICT (poizvedba) DO UPDATE SET st_iskanj = iskanja.st_iskanj + 1, zadnjic = CURRENT_TIMESTAMP
+            """,
+                (poizvedba, query.strip()),
             )
+    except psycopg2.Error as e:
+        print(f"Error logging search: {e}")
+
+
+def ogrej_slovar(slovar: str, poizvedbe: list[tuple[str, str]]):
+    """
+    Zaporedoma osveži rezultate slovarja za dane poizvedbe (normalizirana, izvirna). Med requesti počaka WARMING_DELAY sekund, da slovarja ne obremenimo preveč
+    """
+
+    for poizvedba, izvirna in poizvedbe:
+        try:
+            rezultati = SLOVARJI[slovar](izvirna)
+            if rezultati:
+                shrani_v_cache(slovar, poizvedba, rezultati)
+        except Exception as e:
+            print(f"Error warming {slovar} cache for {poizvedba}: {e}")
+        time.sleep(WARMING_DELAY)
+
+
+def ogrej_cache():
+    """
+    Osveži rezultate najpogostejših poizvedb, ki bi v cache-u potekli pred naslednjim ogrevanjem.
+    Vsak slovar osvežujemo v svoji niti, da omejitev hitrosti velja za vsak slovar posebej.
+    """
+
+    # Povezava drži session advisory lock ves čas ogrevanja, zato ne uporabimo povezave iz poola.
+    # Ogrevanje traja dolgo, zato povezava ne sme ves čas čakati v odprti transakciji
+    connection = psycopg2.connect(**DB_CONFIG)
+    connection.autocommit = True
+
+    try:
+        cursor = connection.cursor()
+
+        # Če imamo več procesov, cache ogreva le tisti, ki dobi lock
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", (WARMING_LOCK_ID,))
+        if not cursor.fetchone()[0]:
+            return
+
+        try:
+            niti = []
+            for slovar in WARMING_SLOVARJI:
+                cursor.execute(
+                    """
+                    SELECT i.poizvedba, i.izvirna
+                    FROM (SELECT poizvedba, izvirna, st_iskanj FROM iskanja ORDER BY st_iskanj DESC LIMIT %s) i
+                    LEFT JOIN slovarji_cache c ON c.slovar = %s AND c.poizvedba = i.poizvedba
+                    WHERE c.osvezeno IS NULL OR c.osvezeno < CURRENT_TIMESTAMP - make_interval(secs => %s)
+                    ORDER BY i.st_iskanj DESC
+                """,
+                    (WARMING_TOP, slovar, max(CACHE_MAX_AGE[slovar] - WARMING_INTERVAL, 0)),
+                )
+                poizvedbe = cursor.fetchall()
+                print(f"Warming {slovar} cache for {len(poizvedbe)} queries")
+
+                nit = threading.Thread(target=ogrej_slovar, args=(slovar, poizvedbe), daemon=True)
+                nit.start()
+                niti.append(nit)
+
+            for nit in niti:
+                nit.join()
+        finally:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (WARMING_LOCK_ID,))
+    finally:
+        # Ob zaprtju povezave se sprosti tudi lock, če ga zgoraj ni bilo mogoče sprostiti
+        connection.close()
+
+
+ogrevanje_zagnano = False
+
+
+def zazeni_ogrevanje():
+    """
+    V ozadju zažene nit, ki vsakih WARMING_INTERVAL sekund ogreje cache
+    """
+
+    global ogrevanje_zagnano
+    if not WARMING_ENABLED or ogrevanje_zagnano:
+        return
+    ogrevanje_zagnano = True
+
+    def ogrevanje():
+        migracije_izvedene.wait()
+        while True:
+            try:
+                ogrej_cache()
+            except psycopg2.Error as e:
+                print(f"Error warming cache: {e}")
+            time.sleep(WARMING_INTERVAL)
+
+    threading.Thread(target=ogrevanje, daemon=True).start()
+
+
+materializiranje = set()  # Poizvedbe, ki se trenutno materializirajo v tem procesu
+materializiranje_lock = threading.Lock()
+
+
+def materializiraj_repozitorij_poizvedbo(poizvedba: str):
+    with materializiranje_lock:
+        if poizvedba in materializiranje:
+            return
+        materializiranje.add(poizvedba)
+    print("Materializing repozitorij query: ", poizvedba)
+
+    try:
+        with db_povezava() as connection:
+            cursor = connection.cursor()
+            cursor.execute("SELECT materializiraj_repozitorij_poizvedbo(%s, %s)", (poizvedba, REPOZITORIJ_MATERIALIZE_TOP))
+    except psycopg2.Error as e:
+        print(f"Error materializing repozitorij query {poizvedba}: {e}")
+    finally:
+        with materializiranje_lock:
+            materializiranje.discard(poizvedba)
+
+
+def repozitorij_poizvedba(cursor, query: str) -> tuple[str, bool]:
+    """
+    Vrne ključ poizvedbe v repozitoriju in ali so njeni zadetki vnaprej izračunani
+    """
+
+    cursor.execute(
+        "SELECT plainto_tsquery(%s)::text, COALESCE((SELECT materializirano FROM repozitorij_poizvedbe WHERE poizvedba = plainto_tsquery(%s)::text), false)",
+        (query, query),
+    )
+    return cursor.fetchone()
+
+
+def med_najpogostejsimi(cursor, poizvedba: str, st_iskanj: int) -> bool:
+    """
+    Ali je poizvedba med REPOZITORIJ_MATERIALIZE_TOP najpogostejšimi. Vrstni red je enak kot v materializiraj_repozitorij_poizvedbo v bazi.
+    """
+
+    cursor.execute(
+        "SELECT COUNT(*) FROM repozitorij_poizvedbe WHERE st_iskanj > %s OR (st_iskanj = %s AND poizvedba < %s)",
+        (st_iskanj, st_iskanj, poizvedba),
+    )
+    return cursor.fetchone()[0] < REPOZITORIJ_MATERIALIZE_TOP
+
+
+def repozitorij_filter(leto: int | None, organizacija: str | None) -> tuple[str, list]:
+    """
+    Vrne poizvedbo za IDje gradiv, ki ustrezajo izbranim filtrom, in njene parametre. Če ni izbranega nobenega filtra, vrne prazno poizvedbo.
+    """
+
+    pogoji = []
+    params = []
+
+    if leto:
+        pogoji.append("g.leto = %s")
+        params.append(leto)
+
+    if organizacija:
+        pogoji.append(
+            """EXISTS (
+                SELECT 1 FROM gradiva_organizacije go
+                JOIN organizacije o ON go.organizacija_id = o.id
+                WHERE go.gradivo_id = g.id AND o.ime_kratko = %s
+            )"""
         )
+        params.append(organizacija)
 
-    cursor.close()
-    connection.close()
+    if not pogoji:
+        return "", []
+
+    return f"SELECT g.id FROM gradiva g WHERE {' AND '.join(pogoji)}", params
+
+
+def repozitorij(query: str, page: int, leto: int | None = None, organizacija: str | None = None) -> list[repozitorij_result]:
+    print("Repozitorij: ", query, "page:", page, "leto:", leto, "organizacija:", organizacija)
+    page_size = 101     # Page size rabi biti vsaj 101, da je spodnji query hiter (iz nekega razloga se pri manjšem limitu čisto pokvari plan in rabi 20+ sec namesto nekaj ms)
+    offset = (page - 1) * page_size
+
+    try:
+        with db_povezava() as connection:
+            cursor = connection.cursor()
+
+            # Zabeleži iskanje. Pogoste poizvedbe imajo zadetke vnaprej izračunane v tabeli repozitorij_zadetki
+            # Listanje po straneh in filtriranje je nadaljevanje istega iskanja, zato ga štejemo le na prvi strani brez filtrov
+            if page == 1 and not leto and not organizacija:
+                cursor.execute(
+                    """
+                    INSERT INTO repozitorij_poizvedbe (poizvedba, st_iskanj) VALUES (plainto_tsquery(%s)::text, 1)
+                    ON CONFLICT (poizvedba) DO UPDATE SET st_iskanj = repozitorij_poizvedbe.st_iskanj + 1
+                    RETURNING poizvedba, st_iskanj, materializirano
+                """,
+                    (query,),
+                )
+                poizvedba, st_iskanj, materializirano = cursor.fetchone()
+                connection.commit()
+
+                # Izračun vseh zadetkov je lahko počasen, zato ga naredimo v ozadju
+                if (
+                    poizvedba
+                    and not materializirano
+                    and st_iskanj >= REPOZITORIJ_MATERIALIZE_AFTER
+                    and med_najpogostejsimi(cursor, poizvedba, st_iskanj)
+                ):
+                    threading.Thread(target=materializiraj_repozitorij_poizvedbo, args=(poizvedba,), daemon=True).start()
+            else:
+                poizvedba, materializirano = repozitorij_poizvedba(cursor, query)
+
+            # Filtre upoštevamo že pri iskanju po straneh, da je iskanje z njimi hitrejše
+            filter_query, filter_params = repozitorij_filter(leto, organizacija)
+
+            if materializirano:
+                filter_sql = f"AND gradivo_id IN ({filter_query})" if filter_query else ""
+                strani_query = f"""
+                SELECT gradivo_id, naslov, leto, repozitorij_url, datoteka_url, stevilke_strani_skupaj
+                FROM repozitorij_zadetki
+                WHERE poizvedba = %s {filter_sql}
+                ORDER BY gradivo_id, datoteka_id
+                LIMIT %s OFFSET %s
+                """
+            else:
+                filter_sql = f"AND datoteka_id IN (SELECT id FROM datoteke WHERE gradivo_id IN ({filter_query}))" if filter_query else ""
+                strani_query = f"""
+                SELECT gradivo_id, naslov, leto, repozitorij_url, url as datoteka_url,
+                    STRING_AGG(stevilka_strani_skupaj::text, ',') as stevilke_strani_skupaj
+                from (SELECT datoteka_id, stevilka_strani_skupaj FROM strani WHERE text_tsv @@ %s::tsquery {filter_sql}) s
+                join datoteke d on s.datoteka_id = d.id
+                join gradiva g on d.gradivo_id = g.id
+                group by gradivo_id, naslov, leto, repozitorij_url, url
+                order by gradivo_id
+                limit %s offset %s
+                """
+
+            cursor.execute(strani_query, (poizvedba, *filter_params, page_size, offset))
+            strani = cursor.fetchall()
+
+            results = []
+            for stran in strani:
+                gradivo_id = stran[0]
+
+                cursor.execute(
+                    """
+                    SELECT ime, priimek
+                    FROM osebe
+                    JOIN gradiva_osebe ON osebe.id = gradiva_osebe.oseba_id
+                    WHERE gradivo_id = %s
+                """,
+                    (gradivo_id,),
+                )
+                avtorji = cursor.fetchall()
+
+                cursor.execute(
+                    """
+                    SELECT ime_kratko
+                    FROM organizacije
+                    JOIN gradiva_organizacije ON organizacije.id = gradiva_organizacije.organizacija_id
+                    WHERE gradivo_id = %s
+                """,
+                    (gradivo_id,),
+                )
+                organizacije = cursor.fetchall()
+
+                results.append(
+                    repozitorij_result(
+                        naslov=stran[1],
+                        leto=stran[2],
+                        avtorji=[f"{a[0]} {a[1]}" for a in avtorji],
+                        organizacije=[o[0] for o in organizacije],
+                        repozitorij_url=stran[3],
+                        datoteka_url=stran[4],
+                        stevilka_strani_skupaj=stran[5].split(","),
+                    )
+                )
+    except psycopg2.Error as e:
+        print(f"Error searching repozitorij for {query}: {e}")
+        return []
 
     return results
 
 
-async def najdi_rezultate(query: str, repozitorij_page: int, enabled_slovarji: Dict[str, bool]) -> Dict[str, Any]:
+def zdruzi_rezultate(results: Dict[str, Any]) -> list[zdruzen_result]:
+    """
+    Združi enake prevode iz različnih slovarjev v en rezultat. Prevodi, s katerimi se strinja več slovarjev, so na začetku.
+    """
+
+    def normaliziraj(izraz: str) -> str:
+        return " ".join(popravi_sumnike(izraz).split()).casefold()
+
+    zdruzeni = {}
+    st_virov = 0
+    for vir, rezultati in results.items():
+        if vir not in IMENA_SLOVARJEV or not rezultati:
+            continue
+        st_virov += 1
+
+        for r in rezultati:
+            kljuc = (normaliziraj(r.en), normaliziraj(r.sl))
+            zdruzen = zdruzeni.get(kljuc)
+            if zdruzen is None:
+                zdruzeni[kljuc] = zdruzen_result(en=r.en.strip(), sl=popravi_sumnike(r.sl).strip(), viri=[IMENA_SLOVARJEV[vir]], ocena=0, st_virov=0)
+            elif IMENA_SLOVARJEV[vir] not in zdruzen.viri:
+                zdruzen.viri.append(IMENA_SLOVARJEV[vir])
+
+    for zdruzen in zdruzeni.values():
+        zdruzen.ocena = len(zdruzen.viri) / st_virov
+        zdruzen.st_virov = st_virov
+
+    # sorted je stabilen, zato ostanejo prevodi z enako oceno v vrstnem redu slovarjev
+    return sorted(zdruzeni.values(), key=lambda z: z.ocena, reverse=True)
+
+
+def repozitorij_fasete_za(query: str, leto: int | None = None, organizacija: str | None = None) -> repozitorij_fasete:
+    """
+    V enem prehodu prešteje gradiva z zadetki, skupaj ter po letih in organizacijah
+    """
+
+    try:
+        with db_povezava() as connection:
+            cursor = connection.cursor()
+
+            poizvedba, materializirano = repozitorij_poizvedba(cursor, query)
+
+            filter_query, filter_params = repozitorij_filter(leto, organizacija)
+
+            # Za pogoste poizvedbe so zadetki že izračunani, drugače jih poiščemo po straneh
+            if materializirano:
+                filter_sql = f"AND gradivo_id IN ({filter_query})" if filter_query else ""
+                zadetki_query = f"SELECT DISTINCT gradivo_id FROM repozitorij_zadetki WHERE poizvedba = %s {filter_sql}"
+            else:
+                filter_sql = f"AND d.gradivo_id IN ({filter_query})" if filter_query else ""
+                zadetki_query = f"""
+                SELECT DISTINCT d.gradivo_id
+                FROM strani s
+                JOIN datoteke d ON s.datoteka_id = d.id
+                WHERE s.text_tsv @@ %s::tsquery {filter_sql}
+                """
+
+            cursor.execute(
+                f"""
+                WITH zadetki AS ({zadetki_query})
+                SELECT g.leto, o.ime_kratko, COUNT(DISTINCT g.id), GROUPING(g.leto, o.ime_kratko)
+                FROM zadetki z
+                JOIN gradiva g ON z.gradivo_id = g.id
+                LEFT JOIN gradiva_organizacije go ON go.gradivo_id = g.id
+                LEFT JOIN organizacije o ON go.organizacija_id = o.id
+                GROUP BY GROUPING SETS ((), (g.leto), (o.ime_kratko))
+            """,
+                (poizvedba, *filter_params),
+            )
+
+            skupaj = 0
+            leta = []
+            organizacije = []
+            for leto, organizacija, stevilo, grouping in cursor.fetchall():
+                if grouping == 3:
+                    skupaj = stevilo
+                elif grouping == 1 and leto is not None:
+                    leta.append((leto, stevilo))
+                elif grouping == 2 and organizacija is not None:
+                    organizacije.append((organizacija, stevilo))
+    except psycopg2.Error as e:
+        print(f"Error counting repozitorij results for {query}: {e}")
+        return repozitorij_fasete(skupaj=0, leta=[], organizacije=[])
+
+    return repozitorij_fasete(
+        skupaj=skupaj,
+        leta=sorted(leta, reverse=True),
+        organizacije=sorted(organizacije, key=lambda o: o[1], reverse=True),
+    )
+
+
+def repozitorij_fasete_strani(query: str, page: int, leto: int | None = None, organizacija: str | None = None) -> repozitorij_fasete:
+    """
+    Fasete štejejo vse zadetke, kar je enako drago ne glede na stran. Zato jih izračunamo na prvi strani in shranimo v cache,
+    naslednje strani pa jih preberejo od tam. Če jih v cache-u ni (npr. povezava direktno na drugo stran), jih izračunamo.
+    """
+
+    # Fasete hranimo v tabeli slovarji_cache pod posebnim imenom vira, ključ vsebuje tudi filtre
+    kljuc = json.dumps([normaliziraj_poizvedbo(query), leto, organizacija], ensure_ascii=False)
+
+    if page > 1:
+        try:
+            with db_povezava() as connection:
+                cursor = connection.cursor()
+                cursor.execute(
+                    """
+                    SELECT rezultati FROM slovarji_cache
+                    WHERE slovar = 'repozitorij_fasete' AND poizvedba = %s AND osvezeno > CURRENT_TIMESTAMP - make_interval(secs => %s)
+                """,
+                    (kljuc, CACHE_MAX_AGE["repozitorij"]),
+                )
+                cached = cursor.fetchone()
+
+            if cached:
+                return repozitorij_fasete(
+                    skupaj=cached[0]["skupaj"],
+                    leta=[tuple(leto) for leto in cached[0]["leta"]],
+                    organizacije=[tuple(organizacija) for organizacija in cached[0]["organizacije"]],
+                )
+        except psycopg2.Error as e:
+            print(f"Error reading repozitorij facets from cache: {e}")
+
+    fasete = repozitorij_fasete_za(query, leto, organizacija)
+
+    # Brez zadetkov ni naslednjih strani, poleg tega je lahko prazen rezultat posledica napake
+    if fasete.skupaj:
+        import psycopg2.extras
+
+        try:
+            with db_povezava() as connection:
+                cursor = connection.cursor()
+                cursor.execute(
+                    """
+                    INSERT INTO slovarji_cache (slovar, poizvedba, rezultati) VALUES ('repozitorij_fasete', %s, %s)
+                    ON CONFLICT (slovar, poizvedba) DO UPDATE SET rezultati = EXCLUDED.rezultati, osvezeno = CURRENT_TIMESTAMP
+                """,
+                    (kljuc, psycopg2.extras.Json(asdict(fasete))),
+                )
+        except psycopg2.Error as e:
+            print(f"Error saving repozitorij facets to cache: {e}")
+
+    return fasete
+
+
+async def najdi_rezultate(
+    query: str, repozitorij_page: int, repozitorij_filtri: Dict[str, Any], enabled_slovarji: Dict[str, bool]
+) -> Dict[str, Any]:
     loop = asyncio.get_running_loop()
     results = {}
 
     tasks = {}
 
     if enabled_slovarji.get("dis_slovarcek"):
-        tasks["dis_slovarcek"] = loop.run_in_executor(None, dis_slovarcek, query)
+        tasks["dis_slovarcek"] = loop.run_in_executor(None, poisci_v_slovarju, "dis_slovarcek", query)
 
     if enabled_slovarji.get("ltfe"):
-        tasks["ltfe"] = loop.run_in_executor(None, ltft, query)
+        tasks["ltfe"] = loop.run_in_executor(None, poisci_v_slovarju, "ltfe", query)
 
     if enabled_slovarji.get("sdrv"):
-        tasks["sdrv"] = loop.run_in_executor(None, sdrv, query)
+        tasks["sdrv"] = loop.run_in_executor(None, poisci_v_slovarju, "sdrv", query)
 
     if enabled_slovarji.get("ijs"):
-        tasks["ijs"] = loop.run_in_executor(None, ijs, query)
+        tasks["ijs"] = loop.run_in_executor(None, poisci_v_slovarju, "ijs", query)
 
     if enabled_slovarji.get("islovar"):
-        tasks["islovar"] = loop.run_in_executor(None, islovar, query)
+        tasks["islovar"] = loop.run_in_executor(None, poisci_v_slovarju, "islovar", query)
 
     if enabled_slovarji.get("ezs_glosar"):
-        tasks["ezs_glosar"] = loop.run_in_executor(None, ezs_glosar, query)
+        tasks["ezs_glosar"] = loop.run_in_executor(None, poisci_v_slovarju, "ezs_glosar", query)
 
     if enabled_slovarji.get("ui_slovar"):
-        tasks["ui_slovar"] = loop.run_in_executor(None, ui_slovar, query)
+        tasks["ui_slovar"] = loop.run_in_executor(None, poisci_v_slovarju, "ui_slovar", query)
 
     if enabled_slovarji.get("google_translate"):
-        tasks["google_translate"] = loop.run_in_executor(None, google_translate, query)
+        tasks["google_translate"] = loop.run_in_executor(None, poisci_v_slovarju, "google_translate", query)
 
     if enabled_slovarji.get("repozitorij"):
-        tasks["repozitorij"] = loop.run_in_executor(None, repozitorij, query, repozitorij_page)
+        tasks["repozitorij"] = loop.run_in_executor(
+            None, repozitorij, query, repozitorij_page, repozitorij_filtri["leto"], repozitorij_filtri["organizacija"]
+        )
+        tasks["repozitorij_fasete"] = loop.run_in_executor(
+            None, repozitorij_fasete_strani, query, repozitorij_page, repozitorij_filtri["leto"], repozitorij_filtri["organizacija"]
+        )
 
     completed = await asyncio.gather(*tasks.values(), return_exceptions=False)
 
@@ -440,6 +1113,77 @@ async def najdi_rezultate(query: str, repozitorij_page: int, enabled_slovarji: D
     return results
 
 
+def predlagaj_izraze(query: str) -> list[str]:
+    """
+    Vrne znane izraze, ki so podobni poizvedbi (npr. če je bila napačno napisana), urejene po podobnosti.
+    Uporablja trigramske indekse nad tabelo izrazi in besedami iz repozitorija.
+    """
+
+    query = " ".join(query.split()).lower()
+    if not query:
+        return []
+
+    try:
+        with db_povezava() as connection:
+            cursor = connection.cursor()
+
+            # Predlogi so le dodatek, zato ne smejo preveč upočasniti iskanja
+            cursor.execute("SELECT set_config('statement_timeout', %s, true)", (str(FUZZY_TIMEOUT),))
+            cursor.execute("SELECT set_config('pg_trgm.similarity_threshold', %s, true)", (str(FUZZY_THRESHOLD),))
+
+            # Besede, ki se v repozitoriju pojavijo le na eni strani, so večinoma napake pri branju PDFjev, zato jih izpustimo (ndoc > 1)
+            cursor.execute(
+                """
+                SELECT MIN(izraz), MAX(podobnost) AS podobnost
+                FROM (
+                    SELECT en AS izraz, similarity(lower(en), %(query)s) AS podobnost FROM izrazi WHERE lower(en) %% %(query)s
+                    UNION ALL
+                    SELECT sl, similarity(lower(sl), %(query)s) FROM izrazi WHERE lower(sl) %% %(query)s
+                    UNION ALL
+                    SELECT beseda, similarity(beseda, %(query)s) FROM besede_strani WHERE beseda %% %(query)s AND ndoc > 1
+                ) p
+                WHERE lower(izraz) <> %(query)s
+                GROUP BY lower(izraz)
+                ORDER BY podobnost DESC
+                LIMIT %(limit)s
+            """,
+                {"query": query, "limit": FUZZY_LIMIT},
+            )
+            predlogi = [vrstica[0] for vrstica in cursor.fetchall()]
+    except psycopg2.Error as e:
+        print(f"Error finding similar terms: {e}")
+        return []
+
+    return predlogi
+
+
+def shrani_izraze(results: Dict[str, Any]):
+    """
+    Rezultate slovarjev shrani v tabelo izrazi in jih doda v indeks za predloge
+    """
+
+    import psycopg2.extras
+
+    izrazi = []
+    for vir, rezultati in results.items():
+        # Rezultati Google Translate so le prevod poizvedbe (ki je lahko napačno napisana), repozitorij pa ne vrača izrazov
+        if vir not in IMENA_SLOVARJEV or vir == "google_translate":
+            continue
+        izrazi.extend((r.en, r.sl, vir) for r in rezultati if r.en and r.sl)
+
+    if not izrazi:
+        return
+
+    try:
+        with db_povezava() as connection:
+            cursor = connection.cursor()
+            psycopg2.extras.execute_values(cursor, "INSERT INTO izrazi (en, sl, vir) VALUES %s ON CONFLICT DO NOTHING", izrazi)
+    except psycopg2.Error as e:
+        print(f"Error saving terms: {e}")
+
+    indeks.dodaj([izraz for en, sl, _ in izrazi for izraz in (en, sl)])
+
+
 @app.route("/")
 def index():
 
@@ -456,14 +1200,45 @@ def index():
         "repozitorij": False,
     }
 
-    return render_template("index.html", enabled_slovarji=enabled_slovarji)
+    return render_template("index.html", enabled_slovarji=enabled_slovarji, zdruzi=True)
+
+
+def izracunaj_etag(*podatki) -> str:
+    serializirano = json.dumps([TEMPLATES_HASH, *podatki], sort_keys=True, ensure_ascii=False, default=asdict)
+    return hashlib.sha256(serializirano.encode()).hexdigest()[:32]
+
+
+def url_iskanja(spremembe: Dict[str, Any]) -> str:
+    """
+    Vrne URL trenutnega iskanja s spremenjenimi parametri. Parametri z vrednostjo None se odstranijo.
+    Stran repozitorija se vedno ponastavi na prvo, ker se s spremembo spremenijo tudi zadetki.
+    """
+
+    args = request.args.to_dict()
+    args.pop("repozitorij-page", None)
+
+    for kljuc, vrednost in spremembe.items():
+        if vrednost is None:
+            args.pop(kljuc, None)
+        else:
+            args[kljuc] = vrednost
+
+    return url_for("search", **args)
 
 
 @app.route("/search")
 def search():
 
+    # Dokler migracije niso izvedene, tabele morda še ne obstajajo
+    if not migracije_izvedene.is_set():
+        return "Iskanje še ni na voljo, poskusite znova čez nekaj sekund", 503, {"Retry-After": "5"}
+
     query = request.args.get("query", "", type=str)
     repozitorij_page = request.args.get("repozitorij-page", 1, type=int)  # Za repozitorij
+    repozitorij_filtri = {
+        "leto": request.args.get("repozitorij-leto", None, type=int),
+        "organizacija": request.args.get("repozitorij-organizacija", None, type=str),
+    }
 
     # Ker uporabljamo navaden HTML form bodo checkboxi, ki niso checked izpuščeni iz requesta
     enabled_slovarji = {
@@ -477,64 +1252,210 @@ def search():
         "google_translate": "google-translate" in request.args and request.args["google-translate"] == "on",
         "repozitorij": "repozitorij" in request.args and request.args["repozitorij"] == "on",
     }
+    zdruzi = "zdruzi" in request.args and request.args["zdruzi"] == "on"
 
     # Requeste na vse slovarje izvedemo hkrati, da prihranimo čas
-    results = asyncio.run(najdi_rezultate(query, repozitorij_page, enabled_slovarji))
-
-    return render_template(
-        "search.html",
-        query=query,
-        repozitorij_page=repozitorij_page,
-        enabled_slovarji=enabled_slovarji,
-        results=results,
-    )
+    results = asyncio.run(najdi_rezultate(query, repozitorij_page, repozitorij_filtri, enabled_slovarji))
+
+    shrani_izraze(results)
+    zabelezi_iskanje(query)
+
+    # Če noben slovar ne vrne rezultatov, je poizvedba morda napačno napisana, zato predlagamo podobne znane izraze
+    # Google Translate vedno nekaj vrne, zato ga ne upoštevamo
+    predlogi = []
+    ima_rezultate = any(results.get(vir) for vir in enabled_slovarji if vir != "google_translate")
+    if "repozitorij_fasete" in results:
+        ima_rezultate = ima_rezultate or results["repozitorij_fasete"].skupaj > 0
+    if not ima_rezultate:
+        predlogi = [(predlog, url_iskanja({"query": predlog})) for predlog in predlagaj_izraze(query)]
+
+    # Združen pogled prikažemo namesto rezultatov posameznih slovarjev
+    zdruzeni = None
+    if zdruzi and any(enabled_slovarji[vir] for vir in IMENA_SLOVARJEV):
+        zdruzeni = zdruzi_rezultate(results)
+
+    # Enaki podatki vedno dajo enako stran, zato lahko ETag izračunamo iz podatkov in se izognemo izrisu strani, če jo odjemalec že ima
+    etag = izracunaj_etag(query, repozitorij_page, repozitorij_filtri, enabled_slovarji, zdruzi, results, predlogi)
+    max_age = min((CACHE_MAX_AGE[vir] for vir, enabled in enabled_slovarji.items() if enabled), default=0)
+
+    if request.if_none_match.contains_weak(etag):
+        response = make_response("", 304)
+    else:
+        response = make_response(
+            render_template(
+                "search.html",
+                query=query,
+                repozitorij_page=repozitorij_page,
+                enabled_slovarji=enabled_slovarji,
+                results=results,
+                repozitorij_filtri=repozitorij_filtri,
+                url_iskanja=url_iskanja,
+                zdruzeni=zdruzeni,
+                zdruzi=zdruzi,
+                predlogi=predlogi,
+            )
+        )
+
+    # ETag je šibek, ker je vsebina lahko stisnjena z gzip ali ne
+    response.set_etag(etag, weak=True)
+    response.cache_control.public = True
+
+    # Slovarji ob napaki vrnejo prazen seznam, zato strani s praznimi rezultati ne shranjujemo, ampak jo odjemalec vsakič preveri (z ETagom)
+    if any(enabled and not results.get(vir) for vir, enabled in enabled_slovarji.items()):
+        response.cache_control.no_cache = True
+    else:
+        response.cache_control.max_age = max_age
+
+    return response
+
+
+@app.route("/autocomplete")
+def autocomplete():
+
+    query = request.args.get("query", "", type=str)
+
+    indeks.osvezi_ce_potrebno()
+
+    response = jsonify(indeks.predlogi(query, AUTOCOMPLETE_LIMIT))
+
+    # Dokler indeks ni naložen, so predlogi nepopolni, zato jih ne smemo shraniti
+    if indeks.nalozen:
+        response.cache_control.public = True
+        response.cache_control.max_age = AUTOCOMPLETE_REFRESH_INTERVAL
+    else:
+        response.cache_control.no_store = True
+
+    return response
+
+
+@app.after_request
+def stisni(response):
+    """
+    Stisne HTML in JSON odgovore, če jih odjemalec podpira
+    """
+
+    if response.mimetype not in ("text/html", "application/json"):
+        return response
+
+    response.vary.add("Accept-Encoding")
+
+    if response.status_code != 200 or response.direct_passthrough or "Content-Encoding" in response.headers:
+        return response
+    if "gzip" not in request.accept_encodings:
+        return response
+
+    data = response.get_data()
+    if len(data) < GZIP_MIN_SIZE:
+        return response
+
+    response.set_data(gzip.compress(data, compresslevel=6))
+    response.headers["Content-Encoding"] = "gzip"
+
+    return response
+
+
+@app.route("/healthz")
+def healthz():
+    # Liveness: proces teče in odgovarja na requeste
+    return "ok"
+
+
+@app.route("/readyz")
+def readyz():
+    # Readiness: migracije so izvedene in baza je dosegljiva
+    if not migracije_izvedene.is_set():
+        return "migrations pending", 503
+
+    try:
+        with db_povezava() as connection:
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1")
+    except psycopg2.Error as e:
+        print(f"Readiness check failed: {e}")
+        return "database unavailable", 503
+
+    return "ok"
+
+
+MIGRATIONS_LOCK_ID = 4202  # ID advisory locka, da migracije hkrati izvaja le en proces
+migracije_izvedene = threading.Event()
 
 
 # V mapi migrations/ so .sql datoteke za migracije. Program si v tabeli migrations zapomni, katere migracije so že bile izvedene.
 # Ob zagonu programa preveri, če so bile vse migracije izvedene. Če ne, jih izvede.
 def run_migrations():
 
+    # Migracije se izvedejo le ob zagonu in držijo session advisory lock, zato ne uporabimo povezave iz poola
     connection = psycopg2.connect(**DB_CONFIG)
-    cursor = connection.cursor()
 
-    # Zagotovi, da tabela migrations obstaja
-    cursor.execute(
+    # Če migracija ne uspe, se transakcija ob zaprtju povezave razveljavi in lock sprosti
+    try:
+        cursor = connection.cursor()
+
+        # Če se hkrati zažene več workerjev, migracije izvede le prvi, ostali počakajo in nato ugotovijo, da so že izvedene.
+        # Lock se sprosti, ko zapremo povezavo
+        cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATIONS_LOCK_ID,))
+
+        # Zagotovi, da tabela migrations obstaja
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS migrations (
+                id SERIAL PRIMARY KEY,
+                name VARCHAR(255) UNIQUE NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
         """
-        CREATE TABLE IF NOT EXISTS migrations (
-            id SERIAL PRIMARY KEY,
-            name VARCHAR(255) UNIQUE NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
-    """
-    )
-    connection.commit()
-
-    # Najdi vse .sql datoteke v mapi migrations/
-    migrations_path = Path(__file__).parent / "migrations"
-    migration_files = sorted(migrations_path.glob("*.sql"))
-    migration_names = [file.stem for file in migration_files]
-
-    # Preveri, katere migracije so že bile izvedene in izvedi tiste, ki še niso
-    for migration_name in migration_names:
-        cursor.execute("SELECT EXISTS (SELECT 1 FROM migrations WHERE name = %s)", (migration_name,))
-        already_migrated = cursor.fetchone()[0]
-        if already_migrated:
-            print(f"Migration {migration_name} already executed.")
-            continue
-        print(f"Executing migration {migration_name}...")
-        with open(f"{migrations_path}/{migration_name}.sql", "r") as file:
-            sql = file.read()
-            cursor.execute(sql)
-            cursor.execute("INSERT INTO migrations (name) VALUES (%s)", (migration_name,))
-            print(f"Migration {migration_name} executed.")
-    connection.commit()
-    cursor.close()
-    connection.close()
+        connection.commit()
+
+        # Najdi vse .sql datoteke v mapi migrations/
+        migrations_path = Path(__file__).parent / "migrations"
+        migration_files = sorted(migrations_path.glob("*.sql"))
+        migration_names = [file.stem for file in migration_files]
+
+        # Preveri, katere migracije so že bile izvedene in izvedi tiste, ki še niso
+        cursor.execute("SELECT name FROM migrations")
+        executed_migrations = {row[0] for row in cursor.fetchall()}
+        for migration_name in migration_names:
+            if migration_name in executed_migrations:
+                continue
+            print(f"Executing migration {migration_name}...")
+            with open(f"{migrations_path}/{migration_name}.sql", "r") as file:
+                sql = file.read()
+                cursor.execute(sql)
+                cursor.execute("INSERT INTO migrations (name) VALUES (%s)", (migration_name,))
+                print(f"Migration {migration_name} executed.")
+        connection.commit()
+    finally:
+        connection.close()
+
+    migracije_izvedene.set()
     print("All migrations executed.")
 
 
+def zazeni_migracije():
+    """
+    Migracije izvede v ozadju, da lahko aplikacija takoj odgovarja na requeste. Dokler niso izvedene, /readyz in /search vračata 503.
+    """
+
+    def migracije():
+        while not migracije_izvedene.is_set():
+            try:
+                run_migrations()
+            except Exception as e:
+                # Tudi napake, ki niso napake baze (npr. neberljiva datoteka), ne smejo tiho ustaviti niti, sicer /search ostane nedosegljiv
+                print(f"Error running migrations, retrying: {e}")
+                time.sleep(5)
+
+        # Ko so tabele pripravljene, naložimo indeks izrazov, da prvi predlogi niso prazni
+        indeks.osvezi_ce_potrebno()
+
+    threading.Thread(target=migracije, daemon=True).start()
+
+
 if __name__ == "__main__":
 
-    run_migrations()
+    zazeni_migracije()
+    zazeni_ogrevanje()
 
     app.run(debug=True)
@@ -0,0 +1,25 @@
+# Konfiguracija za gunicorn. Nastavitve prebere iz razdelka [server] v config.toml
+import tomllib
+from pathlib import Path
+
+config_path = Path(__file__).parent / "config.toml"
+with config_path.open("rb") as f:
+    server_config = tomllib.load(f).get("server", {})
+
+bind = server_config.get("bind", "0.0.0.0:5000")
+
+# Privzeti sync worker med iskanjem po vseh slovarjih obdeluje le en request naenkrat, zato uporabimo niti
+worker_class = server_config.get("worker_class", "gthread")
+workers = server_config.get("workers", 2)
+threads = server_config.get("threads", 16)
+
+# Iskanje po vseh slovarjih lahko traja dlje od privzetih 30 sekund
+timeout = server_config.get("timeout", 60)
+
+
+def post_worker_init(worker):
+    # Migracije in ogrevanje cache-a zaženemo v ozadju v vsakem workerju, advisory locki poskrbijo, da jih hkrati izvaja le eden
+    from app import zazeni_migracije, zazeni_ogrevanje
+
+    zazeni_migracije()
+    zazeni_ogrevanje()
@@ -0,0 +1,68 @@
+import argparse
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# Obremenitveni test za slovar-web: pošilja iskanja z naraščajočim številom hkratnih uporabnikov
+# in izpiše, koliko iskanj na sekundo strežnik zmore ter kako dolgo trajajo.
+# Z --nakljucno ima vsako iskanje drugačno poizvedbo, da rezultati niso v cache-u in se meri iskanje po slovarjih.
+
+
+def iskanje(url: str, params: dict, timeout: float) -> tuple[float, bool]:
+    start = time.perf_counter()
+    try:
+        response = requests.get(f"{url}/search", params=params, timeout=timeout)
+        ok = response.ok
+    except requests.RequestException:
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def obremeni(url: str, params: dict, concurrency: int, st_iskanj: int, timeout: float, nakljucno: bool):
+    def parametri() -> dict:
+        if not nakljucno:
+            return params
+        return params | {"query": f"{params['query']} {random.randrange(10**9)}"}
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        rezultati = list(executor.map(lambda _: iskanje(url, parametri(), timeout), range(st_iskanj)))
+        trajanje = time.perf_counter() - start
+
+    casi = sorted(cas for cas, _ in rezultati)
+    napake = sum(1 for _, ok in rezultati if not ok)
+    p95 = casi[min(len(casi) - 1, int(len(casi) * 0.95))]
+
+    print(
+        f"{concurrency:>11} {st_iskanj / trajanje:>10.1f} {statistics.median(casi) * 1000:>9.0f} {p95 * 1000:>9.0f} {napake:>7}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Obremenitveni test za slovar-web")
+    parser.add_argument("url", help="Naslov strežnika, npr. http://localhost:5000")
+    parser.add_argument("--query", default="računalnik", help="Iskani izraz")
+    parser.add_argument(
+        "--slovarji",
+        default="dis-slovarcek,sdrv,ijs,islovar,ezs_glosar,ui_slovar,google-translate",
+        help="Vklopljeni slovarji, ločeni z vejico (imena checkboxov v obrazcu)",
+    )
+    parser.add_argument("--concurrency", default="1,2,4,8,16,32", help="Števila hkratnih uporabnikov, ločena z vejico")
+    parser.add_argument("--requests", type=int, default=64, help="Število iskanj za vsako število hkratnih uporabnikov")
+    parser.add_argument("--timeout", type=float, default=60, help="Čas v sekundah, po katerem se iskanje šteje kot neuspešno")
+    parser.add_argument(
+        "--nakljucno",
+        action="store_true",
+        help="Iskanemu izrazu doda naključno število, da se vsako iskanje izvede v slovarjih namesto iz cache-a",
+    )
+
+    args = parser.parse_args()
+
+    params = {"query": args.query} | {slovar: "on" for slovar in args.slovarji.split(",") if slovar}
+
+    print("concurrency      req/s  p50 [ms]  p95 [ms]  napake")
+    for concurrency in [int(c) for c in args.concurrency.split(",")]:
+        obremeni(args.url, params, concurrency, max(args.requests, concurrency), args.timeout, args.nakljucno)
@@ -0,0 +1,7 @@
+CREATE TABLE izrazi (
+    id serial PRIMARY KEY,
+    en text NOT NULL,
+    sl text NOT NULL,
+    vir text NOT NULL,
+    CONSTRAINT izrazi_en_sl_vir_key UNIQUE (en, sl, vir)
+);
@@ -0,0 +1,22 @@
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX idx_izrazi_en_trgm ON izrazi USING gin (lower(en) gin_trgm_ops);
+CREATE INDEX idx_izrazi_sl_trgm ON izrazi USING gin (lower(sl) gin_trgm_ops);
+-- Trigramski indeks nad celotnim besedilom strani bi bil prevelik, zato indeksiramo le seznam besed, ki se v straneh pojavijo, in na koliko straneh.
+-- Seznam se posodablja ob dodajanju in brisanju datotek, za obstoječe strani pa ga enkrat napolni `python scrape.py besede`
+CREATE TABLE besede_strani (
+    beseda text PRIMARY KEY,
+    ndoc integer NOT NULL
+);
+CREATE INDEX idx_besede_strani_beseda_trgm ON besede_strani USING gin (beseda gin_trgm_ops);
+-- Prišteje (p_predznak = 1) ali odšteje (p_predznak = -1) besede iz strani ene datoteke
+-- Ob odštevanju odstrani besede te datoteke, ki jim ndoc pade na 0. Strani datoteke morajo takrat še obstajati
+CREATE FUNCTION posodobi_besede_strani(p_datoteka_id integer, p_predznak integer) RETURNS void AS $$
+    INSERT INTO besede_strani (beseda, ndoc)
+    SELECT word, p_predznak * ndoc
+    FROM ts_stat(format('SELECT text_tsv FROM strani WHERE datoteka_id = %s', p_datoteka_id))
+    WHERE length(word) BETWEEN 3 AND 50
+    ON CONFLICT (beseda) DO UPDATE SET ndoc = besede_strani.ndoc + EXCLUDED.ndoc;
+    DELETE FROM besede_strani
+    WHERE p_predznak < 0 AND ndoc <= 0
+        AND beseda IN (SELECT word FROM ts_stat(format('SELECT text_tsv FROM strani WHERE datoteka_id = %s', p_datoteka_id)));
+$$ LANGUAGE sql;
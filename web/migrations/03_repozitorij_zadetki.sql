@@ -0,0 +1,53 @@
+-- Poizvedbe po repozitoriju, ključ je plainto_tsquery(...)::text
+CREATE TABLE repozitorij_poizvedbe (
+    poizvedba text PRIMARY KEY,
+    st_iskanj integer NOT NULL DEFAULT 0,
+    materializirano boolean NOT NULL DEFAULT false
+);
+CREATE INDEX idx_repozitorij_poizvedbe_st_iskanj ON repozitorij_poizvedbe (st_iskanj DESC, poizvedba);
+-- Vnaprej izračunani zadetki pogostih poizvedb, ena vrstica na datoteko
+CREATE TABLE repozitorij_zadetki (
+    poizvedba text NOT NULL,
+    gradivo_id integer NOT NULL,
+    datoteka_id integer NOT NULL,
+    naslov text,
+    leto integer,
+    repozitorij_url text,
+    datoteka_url text,
+    stevilke_strani_skupaj text,
+    PRIMARY KEY (poizvedba, gradivo_id, datoteka_id),
+    CONSTRAINT repozitorij_zadetki_poizvedba_fkey FOREIGN KEY (poizvedba) REFERENCES repozitorij_poizvedbe (poizvedba) ON DELETE CASCADE
+);
+CREATE INDEX idx_repozitorij_zadetki_datoteka_id ON repozitorij_zadetki (datoteka_id);
+-- Izračuna vse zadetke za poizvedbo. Poizvedbam, ki niso več med p_top najpogostejšimi, zadetke odstrani, da se ob dodajanju datotek preverja omejeno število poizvedb
+CREATE FUNCTION materializiraj_repozitorij_poizvedbo(p_poizvedba text, p_top integer) RETURNS void AS $$
+    WITH odstranjene AS (
+        UPDATE repozitorij_poizvedbe SET materializirano = false
+        WHERE materializirano AND poizvedba NOT IN (SELECT poizvedba FROM repozitorij_poizvedbe ORDER BY st_iskanj DESC, poizvedba LIMIT p_top)
+        RETURNING poizvedba
+    )
+    DELETE FROM repozitorij_zadetki WHERE poizvedba IN (SELECT poizvedba FROM odstranjene);
+    DELETE FROM repozitorij_zadetki WHERE poizvedba = p_poizvedba;
+    INSERT INTO repozitorij_zadetki (poizvedba, gradivo_id, datoteka_id, naslov, leto, repozitorij_url, datoteka_url, stevilke_strani_skupaj)
+    SELECT p_poizvedba, g.id, d.id, g.naslov, g.leto, g.repozitorij_url, d.url, STRING_AGG(s.stevilka_strani_skupaj::text, ',')
+    FROM strani s
+    JOIN datoteke d ON s.datoteka_id = d.id
+    JOIN gradiva g ON d.gradivo_id = g.id
+    WHERE s.text_tsv @@ p_poizvedba::tsquery
+    GROUP BY g.id, d.id
+    ON CONFLICT DO NOTHING;
+    UPDATE repozitorij_poizvedbe SET materializirano = true WHERE poizvedba = p_poizvedba;
+$$ LANGUAGE sql;
+-- Ko se datoteka doda ali spremeni, osveži zadetke le za tiste materializirane poizvedbe, ki se pojavijo v njej
+CREATE FUNCTION osvezi_repozitorij_zadetke(p_datoteka_id integer) RETURNS void AS $$
+    DELETE FROM repozitorij_zadetki WHERE datoteka_id = p_datoteka_id;
+    INSERT INTO repozitorij_zadetki (poizvedba, gradivo_id, datoteka_id, naslov, leto, repozitorij_url, datoteka_url, stevilke_strani_skupaj)
+    SELECT p.poizvedba, g.id, d.id, g.naslov, g.leto, g.repozitorij_url, d.url, STRING_AGG(s.stevilka_strani_skupaj::text, ',')
+    FROM repozitorij_poizvedbe p
+    JOIN strani s ON s.datoteka_id = p_datoteka_id AND s.text_tsv @@ p.poizvedba::tsquery
+    JOIN datoteke d ON s.datoteka_id = d.id
+    JOIN gradiva g ON d.gradivo_id = g.id
+    WHERE p.materializirano
+    GROUP BY p.poizvedba, g.id, d.id
+    ON CONFLICT DO NOTHING;
+$$ LANGUAGE sql;
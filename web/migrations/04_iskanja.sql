@@ -0,0 +1,16 @@
+-- Normalizirane poizvedbe in kolikokrat so bile iskane. Izvirna je poizvedba, kot jo je prvič vpisal uporabnik
+CREATE TABLE iskanja (
+    poizvedba text PRIMARY KEY,
+    izvirna text NOT NULL,
+    st_iskanj integer NOT NULL DEFAULT 0,
+    zadnjic timestamp DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX idx_iskanja_st_iskanj ON iskanja (st_iskanj DESC);
+-- Shranjeni rezultati slovarjev, da ne pošiljamo istih requestov večkrat
+CREATE TABLE slovarji_cache (
+    slovar text NOT NULL,
+    poizvedba text NOT NULL,
+    rezultati jsonb NOT NULL,
+    osvezeno timestamp DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (slovar, poizvedba)
+);
@@ -0,0 +1,2 @@
+-- Strani posamezne datoteke se berejo in brišejo ob vsakem dodajanju ali odstranjevanju datoteke v scraperju
+CREATE INDEX idx_strani_datoteka_id ON strani (datoteka_id);